@@ -57,7 +57,7 @@ fi
 
 # 5. Run the Python Config Script
 echo "Running Python setup script..."
-# This will now use the python3 from the venv, which has 'toml'
+# This will now use the python3 from the venv, which has 'tomlkit'
 python3 setup_vscode.py "$ROS_DISTRO"
 
 # 6. Detect Python version
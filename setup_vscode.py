@@ -27,120 +27,268 @@ It performs THREE main actions:
     between import groups).
 
 REQUIREMENTS:
-    - `pip install toml` (for reading/writing pyproject.toml)
+    - `pip install tomlkit` (required; for reading/writing pyproject.toml
+      while preserving its comments and formatting. There is no fallback
+      to the `toml` package.)
+    - Optional: `pip install orjson` (faster settings.json parsing; the
+      standard library `json` module is used when it is missing)
 
 USAGE:
     This script is intended to be run by 'configure.sh'.
     Example: `python3 setup_vscode.py kilted`
+    Set `SETUP_VSCODE_DEBUG=1` to list every Python path that was found.
 """
 
 import json
 import os
+import shutil
+import stat
 import sys
+from bisect import bisect_right
+from functools import cache, partial
 from pathlib import Path
 
-import toml
+# Third-party modules (tomlkit, orjson) and the thread pool are imported
+# where they are used, so early exits do not pay their import cost.
 
+# Resolved once at import, e.g. '3.12' and 'python3.12'
+PY_MAJ_MIN = f'{sys.version_info.major}.{sys.version_info.minor}'
+PY_VER = f'python{PY_MAJ_MIN}'
 
-def get_python_version_string():
-    """Get the 'pythonX.Y' string, e.g., 'python3.12'."""
-    return f'python{sys.version_info.major}.{sys.version_info.minor}'
+# Root of the system ROS 2 installations
+ROS_ROOT = '/opt/ros'
 
+# Print every discovered path when SETUP_VSCODE_DEBUG is set ('' or '0' = off)
+DEBUG = os.environ.get('SETUP_VSCODE_DEBUG', '0') not in ('', '0')
 
-def find_paths_and_packages(workspace_root, python_version, ros_distro):
-    """Find all Python paths including ROS 2 message types."""
-    python_paths = []
-    local_packages = []
+# Threads used to overlap the (I/O-bound) directory probes
+MAX_PROBE_WORKERS = 16
 
-    # Add system ROS 2 Python path
-    if ros_distro:
-        # Base ROS 2 Python path
-        base_ros_path = Path(
-            f'/opt/ros/{ros_distro}/lib/python\
-                             {sys.version_info.major}.{sys.version_info.minor}]\
-                             /site-packages'
-        )
-        if base_ros_path.is_dir():
-            python_paths.append(str(base_ros_path))
-            print(f'Found base ROS path: {base_ros_path}')
-
-        # Also check dist-packages
-        dist_packages_path = Path(
-            f'/opt/ros/{ros_distro}/lib/python\
-                                  {sys.version_info.major}.\
-                                    {sys.version_info.minor}/dist-packages'
-        )
-        if dist_packages_path.is_dir():
-            python_paths.append(str(dist_packages_path))
-            print(f'Found ROS dist-packages: {dist_packages_path}')
+# colcon artifacts in 'install/' that are never packages
+INSTALL_IGNORE = frozenset(
+    {
+        'COLCON_IGNORE',
+        'setup.bash',
+        'setup.sh',
+        'setup.zsh',
+        'local_setup.bash',
+        'local_setup.sh',
+        'local_setup.zsh',
+        '_local_setup_util_sh.py',
+        '_local_setup_util_ps1.py',
+    }
+)
 
-        # Add the lib/python3.xx/site-packages from system ROS
-        system_site_packages = Path(
-            f'/opt/ros/\{ros_distro}/lib/{python_version}/site-packages'
-        )
-        if system_site_packages.is_dir():
-            python_paths.append(str(system_site_packages))
-            print(f'Found system site-packages: {system_site_packages}')
-    else:
-        print('Warning: ROS_DISTRO not set. System paths will be missing.')
 
-    # Add local workspace paths
+def is_package_name(name):
+    """Return True if an 'install/' entry name could be a package."""
+    # Hidden entries and files such as 'setup.bash' all contain a '.'
+    return '.' not in name and name not in INSTALL_IGNORE
+
+
+def is_real_dir(path):
+    """Return True if 'path' is a directory, without resolving symlinks."""
+    try:
+        return stat.S_ISDIR(os.stat(path, follow_symlinks=False).st_mode)
+    except OSError:
+        return False
+
+
+def scan_subdirs(path):
+    """
+    Return the names of the directories directly inside 'path'.
+
+    This costs a single scandir() call. Returns None if 'path' is not a
+    readable directory.
+    """
+    try:
+        with os.scandir(path) as entries:
+            return {
+                entry.name
+                for entry in entries
+                if entry.is_dir(follow_symlinks=False)
+            }
+    except OSError:
+        return None
+
+
+def probe_ros_paths(ros_distro):
+    """Return (label, path) pairs for the system ROS 2 Python paths."""
+    found = []
+
+    # Base ROS 2 Python path and dist-packages, from one listing
+    ros_python_dir = f'{ROS_ROOT}/{ros_distro}/lib/{PY_VER}'
+    ros_dirs = scan_subdirs(ros_python_dir) or set()
+
+    if 'site-packages' in ros_dirs:
+        base_ros_path = os.path.join(ros_python_dir, 'site-packages')
+        found.append(('base ROS path', base_ros_path))
+
+    # Also check dist-packages
+    if 'dist-packages' in ros_dirs:
+        dist_packages_path = os.path.join(ros_python_dir, 'dist-packages')
+        found.append(('ROS dist-packages', dist_packages_path))
+
+    return found
+
+
+def probe_package_paths(package_dir):
+    """Return (label, path) pairs for one 'install/<package>' directory."""
+    found = []
+
+    # Add multiple possible Python paths for Pylance, listing 'lib' once
+    lib_dir = os.path.join(package_dir, 'lib')
+    lib_dirs = scan_subdirs(lib_dir)
+    if lib_dirs is None:
+        return found
+
+    if PY_VER in lib_dirs:
+        site_packages = os.path.join(lib_dir, PY_VER, 'site-packages')
+        if is_real_dir(site_packages):
+            found.append(('local path', site_packages))
+
+    found.append(('local path', lib_dir))
+    return found
+
+
+def probe_env_path(path):
+    """Return a (label, path) pair if a PYTHONPATH entry is a directory."""
+    if os.path.isdir(path):
+        return [('PYTHONPATH', path)]
+    return []
+
+
+def find_paths_and_packages(workspace_root, ros_distro):
+    """Find all Python paths including ROS 2 message types."""
+    # Insertion-ordered dict used as an ordered set of paths
+    python_paths = {}
+    local_packages = []
+    probes = []
+
+    # Bail out before any ROS probing if the workspace is not built
     install_dir = workspace_root / 'install'
     if not install_dir.is_dir():
         print(f"Error: 'install' directory not found at {install_dir}")
         print("Please build your workspace first (e.g., 'colcon build')")
         return [], []
 
-    for package_dir in install_dir.iterdir():
-        if not package_dir.is_dir():
-            continue
+    # Add system ROS 2 Python path
+    if ros_distro:
+        probes.append(partial(probe_ros_paths, ros_distro))
+    else:
+        print('Warning: ROS_DISTRO not set. System paths will be missing.')
+
+    # Add local workspace paths
+    with os.scandir(install_dir) as entries:
+        # Filter on the name first so artifacts are never stat'd
+        package_dirs = [
+            entry
+            for entry in entries
+            if is_package_name(entry.name)
+            and entry.is_dir(follow_symlinks=False)
+        ]
 
+    for package_dir in package_dirs:
         # Add package name for Ruff
         local_packages.append(package_dir.name)
+        probes.append(partial(probe_package_paths, package_dir.path))
 
-        # Add multiple possible Python paths for Pylance
-        possible_paths = [
-            package_dir / f'lib/{python_version}/site-packages',
-            package_dir
-            / f'lib/python\
-            {sys.version_info.major}.{sys.version_info.minor}/site-packages',
-            package_dir / 'lib',
-        ]
+    # Add any paths from PYTHONPATH environment variable
+    probes.extend(
+        partial(probe_env_path, path)
+        for path in os.environ.get('PYTHONPATH', '').split(os.pathsep)
+        if path
+    )
 
-        for possible_path in possible_paths:
-            if possible_path.is_dir():
-                python_paths.append(str(possible_path))
-                print(f'Found local path: {possible_path}')
+    # The probes only wait on the filesystem, so run them concurrently.
+    # map() yields results in submission order, keeping output stable.
+    from concurrent.futures import ThreadPoolExecutor
 
-    # Add any paths from PYTHONPATH environment variable
-    python_path_env = os.environ.get('PYTHONPATH', '')
-    if python_path_env:
-        for path in python_path_env.split(':'):
-            if path and Path(path).is_dir():
-                python_paths.append(path)
-                print(f'Found PYTHONPATH: {path}')
-
-    # De-duplicate paths while preserving order
-    seen = set()
-    unique_paths = []
-    for path in python_paths:
-        if path not in seen:
-            seen.add(path)
-            unique_paths.append(path)
-
-    unique_packages = sorted(list(set(local_packages)))
+    with ThreadPoolExecutor(max_workers=MAX_PROBE_WORKERS) as executor:
+        results = list(executor.map(lambda probe: probe(), probes))
+
+    log = []
+    for found in results:
+        for label, path in found:
+            python_paths[path] = None
+            if DEBUG:
+                log.append(f'Found {label}: {path}')
+
+    if log:
+        print('\n'.join(log))
+
+    unique_paths = list(python_paths)
+
+    unique_packages = sorted(set(local_packages))
 
     print(f'\nFound {len(unique_packages)} local packages for Ruff.')
     print(f'Found {len(unique_paths)} Python paths for Pylance.')
 
     # Debug: Print all paths
-    print('\nPython paths that will be added to Pylance:')
-    for path in unique_paths:
-        print(f'  - {path}')
+    if DEBUG:
+        log = ['\nPython paths that will be added to Pylance:']
+        log.extend(f'  - {path}' for path in unique_paths)
+        print('\n'.join(log))
 
     return unique_paths, unique_packages
 
 
+@cache
+def import_orjson():
+    """Return the orjson module, or None if it is not installed."""
+    try:
+        import orjson
+    except ImportError:  # Optional speed-up; fall back to the stdlib parser
+        return None
+    return orjson
+
+
+def load_json(raw):
+    """Parse JSON from bytes, using orjson when it is available."""
+    orjson = import_orjson()
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def dump_json(data):
+    """
+    Serialise data to indented, key-sorted JSON bytes.
+
+    orjson and json agree on the strings, lists and booleans this script
+    writes, but not on every value: floats render differently (1e20 vs
+    1e+20) and orjson rejects integers wider than 64 bits.
+    """
+    orjson = import_orjson()
+    if orjson is not None:
+        return orjson.dumps(
+            data, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS
+        )
+    return json.dumps(
+        data, indent=2, sort_keys=True, ensure_ascii=False
+    ).encode()
+
+
+def write_bytes_atomic(path, data):
+    """Write data to 'path' in one call, then durably swap it into place."""
+    # Replace the symlink target, not the link, and keep its permissions
+    path = path.resolve()
+    tmp_path = path.with_name(f'{path.name}.tmp')
+    try:
+        with tmp_path.open('wb') as f:
+            f.write(data)
+            # Flush to disk first, so a power loss cannot leave it empty
+            f.flush()
+            os.fsync(f.fileno())
+        if path.exists():
+            shutil.copymode(path, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        # Never leave a stray '.tmp' file behind in the workspace
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
 def update_vscode_settings(workspace_root, python_paths, interpreter_path):
     """Update .vscode/settings.json with all necessary Python paths."""
     settings_dir = workspace_root / '.vscode'
@@ -148,10 +296,12 @@ def update_vscode_settings(workspace_root, python_paths, interpreter_path):
     settings_file = settings_dir / 'settings.json'
 
     settings_data = {}
+    old_bytes = b''
     if settings_file.exists():
+        old_bytes = settings_file.read_bytes()
         try:
-            with settings_file.open('r') as f:
-                settings_data = json.load(f)
+            settings_data = load_json(old_bytes)
+        # orjson.JSONDecodeError is a subclass of json.JSONDecodeError
         except json.JSONDecodeError:
             print(f"Warning: '{settings_file}' is corrupted. Overwriting.")
             settings_data = {}
@@ -159,9 +309,11 @@ def update_vscode_settings(workspace_root, python_paths, interpreter_path):
     # Set the default interpreter to the one from venv
     settings_data['python.defaultInterpreterPath'] = interpreter_path
 
-    # Add Pylance/AutoComplete paths for ROS 2
-    settings_data['python.analysis.extraPaths'] = python_paths
-    settings_data['python.autoComplete.extraPaths'] = python_paths
+    # Add Pylance/AutoComplete paths for ROS 2. Sorted so that a change in
+    # discovery order does not rewrite the file and make Pylance reindex.
+    sorted_paths = sorted(python_paths)
+    settings_data['python.analysis.extraPaths'] = sorted_paths
+    settings_data['python.autoComplete.extraPaths'] = sorted_paths
 
     settings_data['python.analysis.typeCheckingMode'] = 'basic'
     settings_data['python.analysis.diagnosticMode'] = 'openFilesOnly'
@@ -170,8 +322,13 @@ def update_vscode_settings(workspace_root, python_paths, interpreter_path):
 
     # Write the settings back
     try:
-        with settings_file.open('w') as f:
-            json.dump(settings_data, f, indent=2)
+        # Skip the write if nothing changed, so VS Code does not reload
+        new_bytes = dump_json(settings_data)
+        if new_bytes == old_bytes:
+            print(f"'{settings_file}' is already up to date")
+            return
+
+        write_bytes_atomic(settings_file, new_bytes)
         print(f"Successfully updated '{settings_file}'")
     except Exception as e:
         print(f"Error writing to '{settings_file}': {e}")
@@ -179,6 +336,13 @@ def update_vscode_settings(workspace_root, python_paths, interpreter_path):
 
 def update_pyproject_toml(workspace_root, local_packages):
     """Update pyproject.toml with [tool.ruff.lint.isort].known-first-party."""
+    try:
+        import tomlkit
+    except ImportError:
+        print("Error: 'tomlkit' is not installed; pyproject.toml not updated")
+        print('Install it in your venv with: pip install tomlkit')
+        return
+
     toml_file = workspace_root / 'pyproject.toml'
 
     if not toml_file.exists():
@@ -187,9 +351,8 @@ def update_pyproject_toml(workspace_root, local_packages):
         return
 
     try:
-        # Read existing TOML data
-        with toml_file.open('r') as f:
-            toml_data = toml.load(f)
+        # Read existing TOML data, keeping comments and formatting intact
+        toml_data = tomlkit.parse(toml_file.read_text(encoding='utf-8'))
 
         # --- Safely navigate and create keys if they don't exist ---
         tool_section = toml_data.setdefault('tool', {})
@@ -197,19 +360,37 @@ def update_pyproject_toml(workspace_root, local_packages):
         lint_section = ruff_section.setdefault('lint', {})
         isort_section = lint_section.setdefault('isort', {})
 
-        # Get existing list, or an empty one
+        # Get existing packages, or an empty set
         known_first_party = isort_section.get('known-first-party', [])
+        if not isinstance(known_first_party, list):
+            print(
+                f"Error: 'known-first-party' in '{toml_file}' is not a list. "
+                'Leaving the file unchanged.'
+            )
+            return
+        existing = set(known_first_party)
 
         # --- Add new packages and de-duplicate ---
         # This preserves any packages you added manually
-        updated_list = sorted(list(set(known_first_party + local_packages)))
-
-        # Write the updated list back
-        isort_section['known-first-party'] = updated_list
+        merged = existing.union(local_packages)
+
+        # Nothing new to add, so leave the file untouched
+        if merged == existing:
+            print(f"'{toml_file}' is already up to date")
+            return
+
+        # Insert only the new names into an existing array, each at its
+        # sorted position, so its layout and per-item comments survive;
+        # otherwise create the key
+        if isinstance(known_first_party, tomlkit.items.Array):
+            for name in sorted(merged - existing):
+                names = [str(item) for item in known_first_party]
+                known_first_party.insert(bisect_right(names, name), name)
+        else:
+            isort_section['known-first-party'] = tomlkit.item(sorted(merged))
 
         # Write the data back to the file
-        with toml_file.open('w') as f:
-            toml.dump(toml_data, f)
+        write_bytes_atomic(toml_file, tomlkit.dumps(toml_data).encode())
 
         print(f"Successfully updated '{toml_file}'")
 
@@ -230,9 +411,8 @@ def main():
     ros_distro = sys.argv[1]
     print(f'Using ROS_DISTRO: {ros_distro}')
 
-    # 2. Get other paths and versions
+    # 2. Get other paths
     workspace_root = Path.cwd()
-    python_version = get_python_version_string()
 
     # Get the full path to the currently running Python interpreter
     # (This will be from the venv if configure.sh activated it)
@@ -240,11 +420,11 @@ def main():
     print(f'Using Python interpreter: {interpreter_path}')
 
     print(f'Workspace root: {workspace_root}')
-    print(f'Python version: {python_version}\n')
+    print(f'Python version: {PY_VER}\n')
 
     # 3. Find all paths and packages
     python_paths, local_packages = find_paths_and_packages(
-        workspace_root, python_version, ros_distro
+        workspace_root, ros_distro
     )
 
     if not python_paths and not local_packages:
@@ -0,0 +1,283 @@
+"""Tests for the setup_vscode.py workspace configurator."""
+
+import json
+import os
+import subprocess
+import sys
+import tomllib
+from pathlib import Path
+
+import pytest
+
+import setup_vscode
+from setup_vscode import PY_VER
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    """Create a colcon-style workspace with a few packages and artifacts."""
+    install = tmp_path / 'install'
+    (install / 'pkg_a' / 'lib' / PY_VER / 'site-packages').mkdir(parents=True)
+    (install / 'pkg_b' / 'lib').mkdir(parents=True)
+    (install / 'pkg_c' / 'share').mkdir(parents=True)
+
+    # colcon artifacts that must never be treated as packages
+    (install / '.hidden_pkg' / 'lib').mkdir(parents=True)
+    (install / 'COLCON_IGNORE' / 'lib').mkdir(parents=True)
+    (install / 'setup.bash').touch()
+    (install / '_local_setup_util_sh.py').touch()
+
+    (tmp_path / 'pyproject.toml').write_text(
+        '# Ruff config (café)\n'
+        '[tool.ruff.lint.isort]\n'
+        'known-first-party = [\n'
+        '    "pkg_b",  # added by hand\n'
+        '    "rclpy",\n'
+        ']\n',
+        encoding='utf-8',
+    )
+
+    monkeypatch.delenv('PYTHONPATH', raising=False)
+    return tmp_path
+
+
+def read_known_first_party(workspace):
+    """Return the known-first-party list from the workspace pyproject."""
+    with (workspace / 'pyproject.toml').open('rb') as f:
+        return tomllib.load(f)['tool']['ruff']['lint']['isort'][
+            'known-first-party'
+        ]
+
+
+def test_update_pyproject_toml_keeps_comments_and_order(workspace):
+    """New packages are inserted in sorted order, keeping comments."""
+    setup_vscode.update_pyproject_toml(workspace, ['zzz', 'pkg_b', 'aaa'])
+
+    assert read_known_first_party(workspace) == [
+        'aaa',
+        'pkg_b',
+        'rclpy',
+        'zzz',
+    ]
+    text = (workspace / 'pyproject.toml').read_text(encoding='utf-8')
+    assert '"pkg_b",  # added by hand' in text
+    assert text.startswith('# Ruff config (café)\n')
+
+
+def test_update_pyproject_toml_creates_missing_key(tmp_path):
+    """A pyproject.toml without the isort section gets a sorted list."""
+    (tmp_path / 'pyproject.toml').write_text('[project]\nname = "x"\n')
+
+    setup_vscode.update_pyproject_toml(tmp_path, ['pkg_b', 'pkg_a'])
+
+    assert read_known_first_party(tmp_path) == ['pkg_a', 'pkg_b']
+
+
+def test_update_pyproject_toml_rejects_non_list(tmp_path, capsys):
+    """A string known-first-party value is reported, not rewritten."""
+    original = '[tool.ruff.lint.isort]\nknown-first-party = "abc"\n'
+    (tmp_path / 'pyproject.toml').write_text(original)
+
+    setup_vscode.update_pyproject_toml(tmp_path, ['pkg_a'])
+
+    assert (tmp_path / 'pyproject.toml').read_text() == original
+    assert 'is not a list' in capsys.readouterr().out
+
+
+def test_second_run_writes_nothing(workspace, monkeypatch):
+    """Re-running with the same inputs leaves both files untouched."""
+    python_paths, local_packages = setup_vscode.find_paths_and_packages(
+        workspace, ''
+    )
+    setup_vscode.update_vscode_settings(workspace, python_paths, 'py')
+    setup_vscode.update_pyproject_toml(workspace, local_packages)
+
+    writes = []
+    monkeypatch.setattr(
+        setup_vscode,
+        'write_bytes_atomic',
+        lambda path, data: writes.append(path),
+    )
+    setup_vscode.update_vscode_settings(workspace, python_paths, 'py')
+    setup_vscode.update_pyproject_toml(workspace, local_packages)
+
+    assert writes == []
+
+
+def test_probe_ros_paths(tmp_path, monkeypatch):
+    """The ROS site-packages and dist-packages directories are found."""
+    ros_python_dir = tmp_path / 'kilted' / 'lib' / PY_VER
+    (ros_python_dir / 'site-packages').mkdir(parents=True)
+    (ros_python_dir / 'dist-packages').mkdir()
+    monkeypatch.setattr(setup_vscode, 'ROS_ROOT', str(tmp_path))
+
+    assert setup_vscode.probe_ros_paths('kilted') == [
+        ('base ROS path', str(ros_python_dir / 'site-packages')),
+        ('ROS dist-packages', str(ros_python_dir / 'dist-packages')),
+    ]
+    assert setup_vscode.probe_ros_paths('humble') == []
+
+
+def test_find_paths_and_packages(workspace):
+    """Site-packages and lib directories are found for real packages."""
+    python_paths, local_packages = setup_vscode.find_paths_and_packages(
+        workspace, ''
+    )
+
+    install = workspace / 'install'
+    assert local_packages == ['pkg_a', 'pkg_b', 'pkg_c']
+    assert sorted(python_paths) == sorted(
+        [
+            str(install / 'pkg_a' / 'lib' / PY_VER / 'site-packages'),
+            str(install / 'pkg_a' / 'lib'),
+            str(install / 'pkg_b' / 'lib'),
+        ]
+    )
+
+
+def test_json_falls_back_to_stdlib(workspace, monkeypatch, capsys):
+    """Without orjson, settings.json is read and written with json."""
+    monkeypatch.setattr(setup_vscode, 'import_orjson', lambda: None)
+    settings_file = workspace / '.vscode' / 'settings.json'
+    settings_file.parent.mkdir()
+    settings_file.write_text('{"editor.rulers": [79], "z": "é"}')
+
+    setup_vscode.update_vscode_settings(workspace, ['/a'], 'py')
+
+    data = json.loads(settings_file.read_bytes())
+    assert data['editor.rulers'] == [79]
+    assert (
+        settings_file.read_bytes()
+        == json.dumps(
+            data, indent=2, sort_keys=True, ensure_ascii=False
+        ).encode()
+    )
+
+    settings_file.write_text('{not json')
+    setup_vscode.update_vscode_settings(workspace, ['/a'], 'py')
+    assert 'is corrupted' in capsys.readouterr().out
+
+
+def test_json_backends_agree(monkeypatch):
+    """Both JSON backends serialise typical settings to the same bytes."""
+    pytest.importorskip('orjson')
+    data = {'b': ['/x', 'é'], 'a': {'flag': False, 'none': None}, 'n': 2}
+
+    with_orjson = setup_vscode.dump_json(data)
+    monkeypatch.setattr(setup_vscode, 'import_orjson', lambda: None)
+
+    assert setup_vscode.dump_json(data) == with_orjson
+    assert setup_vscode.load_json(with_orjson) == data
+
+
+def test_is_package_name_filters_colcon_artifacts():
+    """Hidden entries, files and colcon markers are not packages."""
+    assert setup_vscode.is_package_name('pkg_a')
+    for name in (
+        '.colcon_install_layout',
+        'COLCON_IGNORE',
+        'setup.bash',
+        'local_setup.zsh',
+        '_local_setup_util_ps1.py',
+    ):
+        assert not setup_vscode.is_package_name(name)
+
+
+def test_write_bytes_atomic_follows_symlink(tmp_path):
+    """A symlinked target is updated in place and keeps its mode."""
+    target = tmp_path / 'real.json'
+    target.write_bytes(b'{}')
+    target.chmod(0o664)
+    link = tmp_path / 'settings.json'
+    link.symlink_to(target)
+
+    setup_vscode.write_bytes_atomic(link, b'{"a": 1}')
+
+    assert link.is_symlink()
+    assert target.read_bytes() == b'{"a": 1}'
+    assert target.stat().st_mode & 0o777 == 0o664
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        'real.json',
+        'settings.json',
+    ]
+
+
+def test_write_bytes_atomic_removes_temp_file_on_error(tmp_path):
+    """A failed replace leaves no '.tmp' file behind."""
+    target = tmp_path / 'settings.json'
+    target.mkdir()
+
+    with pytest.raises(OSError):
+        setup_vscode.write_bytes_atomic(target, b'{}')
+
+    assert [p.name for p in tmp_path.iterdir()] == ['settings.json']
+
+
+def test_discovery_output_only_in_debug_mode(workspace, monkeypatch, capsys):
+    """Per-path messages are printed only when DEBUG is on."""
+    monkeypatch.setattr(setup_vscode, 'DEBUG', False)
+    setup_vscode.find_paths_and_packages(workspace, '')
+    quiet = capsys.readouterr().out
+    assert 'Found local path' not in quiet
+    assert 'Found 3 local packages for Ruff.' in quiet
+
+    monkeypatch.setattr(setup_vscode, 'DEBUG', True)
+    setup_vscode.find_paths_and_packages(workspace, '')
+    assert 'Found local path' in capsys.readouterr().out
+
+
+@pytest.mark.parametrize(
+    'value, expected', [('', False), ('0', False), ('1', True)]
+)
+def test_debug_env_var(monkeypatch, value, expected):
+    """SETUP_VSCODE_DEBUG turns debug output on unless empty or '0'."""
+    monkeypatch.setenv('SETUP_VSCODE_DEBUG', value)
+    result = subprocess.run(
+        [
+            sys.executable,
+            '-c',
+            'import setup_vscode; print(setup_vscode.DEBUG)',
+        ],
+        cwd=Path(__file__).resolve().parents[1],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip() == str(expected)
+
+
+def test_pythonpath_split_on_pathsep(workspace, monkeypatch):
+    """PYTHONPATH is split on os.pathsep; only real directories are kept."""
+    first = workspace / 'extra_a'
+    second = workspace / 'extra_b'
+    first.mkdir()
+    second.mkdir()
+    monkeypatch.setenv(
+        'PYTHONPATH',
+        os.pathsep.join(
+            [str(first), '', str(workspace / 'missing'), str(second)]
+        ),
+    )
+
+    python_paths, _ = setup_vscode.find_paths_and_packages(workspace, '')
+
+    assert python_paths[-2:] == [str(first), str(second)]
+    assert str(workspace / 'missing') not in python_paths
+
+
+def test_find_paths_and_packages_without_install(tmp_path, capsys):
+    """An unbuilt workspace returns nothing before any ROS probing."""
+    assert setup_vscode.find_paths_and_packages(tmp_path, '') == ([], [])
+    out = capsys.readouterr().out
+    assert "'install' directory not found" in out
+    assert 'ROS_DISTRO not set' not in out
+
+
+def test_update_vscode_settings_sorts_extra_paths(workspace):
+    """The extraPaths lists are written in sorted order."""
+    setup_vscode.update_vscode_settings(workspace, ['/b', '/c', '/a'], 'py')
+
+    settings = json.loads((workspace / '.vscode/settings.json').read_text())
+    assert settings['python.analysis.extraPaths'] == ['/a', '/b', '/c']
+    assert settings['python.autoComplete.extraPaths'] == ['/a', '/b', '/c']
+    assert settings['python.defaultInterpreterPath'] == 'py'